@@ -2,24 +2,105 @@
 """
 Inter-Agent Communication Demo using OpenHands Agent SDK.
 This example demonstrates two agents communicating with each other through custom messaging tools.
+
+Performance notes: the demo is I/O-bound. Wall time is dominated by the LLM
+HTTP round-trips (seconds per turn); the only notable CPU cost is pydantic
+validation of the Action/Observation/Tool models. Optimizations that pay off
+here are concurrency between the agents, cheap message passing (deque +
+Event mailboxes) and building pydantic models once - not SIMD or GPU work.
 """
 
+import asyncio
 import os
 import threading
 import time
-from typing import Dict, Any, Optional, Sequence
-from queue import Queue, Empty
+import uuid
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Deque, Dict, Any, Optional, Sequence, Tuple
 from pydantic import SecretStr, Field
 from openhands.sdk import LLM, Conversation, get_logger
 from openhands.sdk.preset.default import get_default_agent
-from openhands.sdk.tool import ActionBase, ObservationBase, Tool, ToolExecutor, ToolAnnotations, register_tool
+from openhands.sdk.tool import ActionBase, ObservationBase, Tool, ToolExecutor, ToolAnnotations, ToolSpec, register_tool
 from openhands.sdk.llm import TextContent
 
 # Set up logging
 logger = get_logger(__name__)
 
-# Global message queues for inter-agent communication
-agent_queues: Dict[str, Queue] = {}
+# How long a conversation that waits for the first incoming message will block
+FIRST_MESSAGE_TIMEOUT = 60
+
+# Upper bound on agent steps (LLM calls) for one conversation.run(); each
+# exchange is roughly a send plus a receive, with headroom for other tools
+MAX_ITERATIONS_PER_RUN = 30
+
+# Receive timeout (seconds) the agents are told to use while waiting for a
+# reply; long enough to cover the peer's LLM turn
+REPLY_TIMEOUT = 30
+
+# Who each agent talks to, and the instructions appended to its initial
+# prompt so it keeps the exchange going on its own within a single run
+PEERS = {"Alice": "Bob", "Bob": "Alice"}
+EXCHANGE_TEMPLATE = """
+    Keep the conversation with {peer} going for about {exchanges} exchanges. After each message you send,
+    use 'receive_messages_{agent_id}' with a timeout of {timeout} seconds to wait for {peer}'s reply, then
+    respond using 'send_message_{agent_id}'. Finish once the exchanges are done or {peer} stops replying.
+    """
+
+# Registry names for the messaging tools. Both are registered once at import;
+# the bus and agent they belong to are passed through the ToolSpec params.
+SEND_MESSAGE_TOOL = "send_message"
+RECEIVE_MESSAGES_TOOL = "receive_messages"
+
+# Tool annotations are identical for every agent, so build them once
+_SEND_ANNOTATIONS = ToolAnnotations(
+    title="Send Message",
+    readOnlyHint=False,
+    destructiveHint=False,
+    idempotentHint=False,
+    openWorldHint=True,
+)
+_RECEIVE_ANNOTATIONS = ToolAnnotations(
+    title="Receive Messages",
+    readOnlyHint=True,
+    destructiveHint=False,
+    idempotentHint=False,
+    openWorldHint=True,
+)
+
+# Live message buses by bus_id, so the tool factories can find the bus named
+# in a ToolSpec. Weak values let a finished bus be garbage collected.
+_BUSES: "weakref.WeakValueDictionary[str, MessageBus]" = weakref.WeakValueDictionary()
+
+def _drain(queue: Deque[str]) -> list[str]:
+    """Take every pending message out of a mailbox in one go.
+    
+    Pops exactly as many items as were queued on entry rather than calling
+    clear(), so a message appended by a sender mid-drain is never lost.
+    """
+    return [queue.popleft() for _ in range(len(queue))]
+
+@dataclass
+class MessageBus:
+    """Mailboxes for a group of agents that talk to each other.
+    
+    Each agent has a deque of pending messages (append/popleft are atomic under
+    the GIL) plus an Event that is set whenever a new message lands in it.
+    The bus also owns each agent's messaging tools, so agents with the same id
+    on different buses never share executors.
+    """
+    queues: Dict[str, Tuple[Deque[str], threading.Event]] = field(default_factory=dict)
+    tools: Dict[str, Tuple[list[Tool], list[Tool]]] = field(default_factory=dict)
+    bus_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    
+    def __post_init__(self):
+        _BUSES[self.bus_id] = self
+    
+    def ensure_queue(self, agent_id: str) -> None:
+        """Create the mailbox for an agent if it does not exist yet."""
+        if agent_id not in self.queues:
+            self.queues[agent_id] = (deque(), threading.Event())
 
 class SendMessageAction(ActionBase):
     """Action for sending a message to another agent."""
@@ -51,7 +132,7 @@ class ReceiveMessagesObservation(ObservationBase):
     @property
     def agent_observation(self) -> Sequence[TextContent]:
         if self.messages:
-            message_text = f"Received {self.count} message(s):\n" + "\n".join(f"• {msg}" for msg in self.messages)
+            message_text = f"Received {self.count} message(s):\n• " + "\n• ".join(self.messages)
         else:
             message_text = "No messages received"
         return [TextContent(text=message_text)]
@@ -59,76 +140,69 @@ class ReceiveMessagesObservation(ObservationBase):
 class InterAgentMessenger(ToolExecutor):
     """Custom tool executor that allows agents to send messages to each other."""
     
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, bus: MessageBus):
         self.agent_id = agent_id
-        # Ensure this agent has a message queue
-        if agent_id not in agent_queues:
-            agent_queues[agent_id] = Queue()
+        self.bus = bus
+        # Sender prefix never changes, so build it once
+        self._prefix = f"[From {agent_id}]: "
     
     def __call__(self, action: SendMessageAction) -> SendMessageObservation:
         """Send a message to another agent."""
+        recipient_id = action.recipient_id
+        # Mailboxes are created up front by create_agent_with_messaging
         try:
-            if action.recipient_id not in agent_queues:
-                agent_queues[action.recipient_id] = Queue()
-            
-            # Add sender information to the message
-            full_message = f"[From {self.agent_id}]: {action.message}"
-            agent_queues[action.recipient_id].put(full_message)
-            
-            return SendMessageObservation(
-                success=True,
-                message=f"Message sent to {action.recipient_id}: {action.message}",
-                recipient=action.recipient_id,
-                sender=self.agent_id
-            )
-        except Exception as e:
-            return SendMessageObservation(
-                success=False,
-                message=f"Failed to send message to {action.recipient_id}: {str(e)}",
-                recipient=action.recipient_id,
-                sender=self.agent_id
-            )
+            queue, event = self.bus.queues[recipient_id]
+        except KeyError:
+            return self._observation(recipient_id, False, f"Failed to send message to {recipient_id}: unknown recipient")
+        
+        # Add sender information to the message
+        queue.append(self._prefix + action.message)
+        event.set()
+        
+        return self._observation(recipient_id, True, f"Message sent to {recipient_id}: {action.message}")
+    
+    def _observation(self, recipient_id: str, success: bool, message: str) -> SendMessageObservation:
+        """Build the observation; recipient and sender are shared by every outcome."""
+        return SendMessageObservation(
+            success=success,
+            message=message,
+            recipient=recipient_id,
+            sender=self.agent_id
+        )
 
 class MessageReceiver(ToolExecutor):
     """Custom tool executor that allows agents to receive messages from other agents."""
     
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, bus: MessageBus):
         self.agent_id = agent_id
-        # Ensure this agent has a message queue
-        if agent_id not in agent_queues:
-            agent_queues[agent_id] = Queue()
+        self.bus = bus
     
     def __call__(self, action: ReceiveMessagesAction) -> ReceiveMessagesObservation:
         """Check for incoming messages from other agents."""
-        try:
-            messages = []
-            start_time = time.time()
-            
-            # Collect all available messages within the timeout period
-            while time.time() - start_time < action.timeout:
-                try:
-                    message = agent_queues[self.agent_id].get_nowait()
-                    messages.append(message)
-                except Empty:
-                    if messages:  # If we have some messages, return them
-                        break
-                    time.sleep(0.1)  # Brief pause before checking again
-            
-            return ReceiveMessagesObservation(
-                success=True,
-                messages=messages,
-                count=len(messages),
-                recipient=self.agent_id
-            )
-        except Exception as e:
-            return ReceiveMessagesObservation(
-                success=False,
-                messages=[],
-                count=0,
-                recipient=self.agent_id
-            )
+        queue, event = self.bus.queues[self.agent_id]
+        
+        # Block until a message arrives (or the deadline passes), then
+        # drain everything that is waiting. The event is cleared before
+        # draining so a message appended mid-drain re-arms it; a stale
+        # wakeup with an empty queue just waits again for the remainder.
+        deadline = time.monotonic() + action.timeout
+        while not queue:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event.wait(remaining)
+            event.clear()
+        event.clear()
+        messages = _drain(queue)
+        
+        return ReceiveMessagesObservation(
+            success=True,
+            messages=messages,
+            count=len(messages),
+            recipient=self.agent_id
+        )
 
-def create_messaging_tools(agent_id: str) -> Sequence[Tool]:
+def create_messaging_tools(agent_id: str, bus: MessageBus) -> Sequence[Tool]:
     """Create messaging tools for an agent."""
     
     # Create send message tool
@@ -137,14 +211,8 @@ def create_messaging_tools(agent_id: str) -> Sequence[Tool]:
         description=f"Send a message to another agent. Use this to communicate with other agents in the system.",
         action_type=SendMessageAction,
         observation_type=SendMessageObservation,
-        annotations=ToolAnnotations(
-            title=f"Send Message ({agent_id})",
-            readOnlyHint=False,
-            destructiveHint=False,
-            idempotentHint=False,
-            openWorldHint=True,
-        ),
-        executor=InterAgentMessenger(agent_id)
+        annotations=_SEND_ANNOTATIONS,
+        executor=InterAgentMessenger(agent_id, bus)
     )
     
     # Create receive messages tool
@@ -153,27 +221,27 @@ def create_messaging_tools(agent_id: str) -> Sequence[Tool]:
         description=f"Check for incoming messages from other agents. Use this to see if other agents have sent you any messages.",
         action_type=ReceiveMessagesAction,
         observation_type=ReceiveMessagesObservation,
-        annotations=ToolAnnotations(
-            title=f"Receive Messages ({agent_id})",
-            readOnlyHint=True,
-            destructiveHint=False,
-            idempotentHint=False,
-            openWorldHint=True,
-        ),
-        executor=MessageReceiver(agent_id)
+        annotations=_RECEIVE_ANNOTATIONS,
+        executor=MessageReceiver(agent_id, bus)
     )
     
     return [send_tool, receive_tool]
 
-def create_agent_with_messaging(agent_id: str, llm: LLM, working_dir: str):
-    """Create an agent with messaging capabilities."""
+# The SDK calls these factories with the ToolSpec params as keyword arguments
+register_tool(SEND_MESSAGE_TOOL, lambda bus_id, agent_id: _BUSES[bus_id].tools[agent_id][0])
+register_tool(RECEIVE_MESSAGES_TOOL, lambda bus_id, agent_id: _BUSES[bus_id].tools[agent_id][1])
+
+def create_agent_with_messaging(agent_id: str, llm: LLM, working_dir: str, bus: MessageBus, peer_ids: Sequence[str] = ()):
+    """Create an agent with messaging capabilities on the given message bus."""
     
-    # Register the messaging tools for this agent
-    messenger_tool_name = f"send_message_{agent_id}"
-    receiver_tool_name = f"receive_messages_{agent_id}"
+    # Create the mailboxes this agent reads from and sends to, so the
+    # send/receive hot paths never have to check for them
+    for mailbox_id in (agent_id, *peer_ids):
+        bus.ensure_queue(mailbox_id)
     
-    register_tool(messenger_tool_name, lambda: create_messaging_tools(agent_id)[:1])  # Send tool only
-    register_tool(receiver_tool_name, lambda: create_messaging_tools(agent_id)[1:])   # Receive tool only
+    # Build this agent's tools once; every resolution returns the same lists
+    send_tool, receive_tool = create_messaging_tools(agent_id, bus)
+    bus.tools[agent_id] = ([send_tool], [receive_tool])
     
     # Get default agent
     agent = get_default_agent(
@@ -182,49 +250,68 @@ def create_agent_with_messaging(agent_id: str, llm: LLM, working_dir: str):
         cli_mode=True,
     )
     
-    # Add messaging tools to the agent
-    from openhands.sdk.tool import ToolSpec
-    messaging_tools = [
-        ToolSpec(name=messenger_tool_name, params={}),
-        ToolSpec(name=receiver_tool_name, params={})
-    ]
-    
-    # Add the messaging tools to the existing tools
-    agent.tools.extend(messaging_tools)
+    # Add the messaging tools to the existing tools; the shared registrations
+    # resolve them to this agent's executors on this bus via the params
+    params = {"bus_id": bus.bus_id, "agent_id": agent_id}
+    agent.tools.extend([
+        ToolSpec(name=SEND_MESSAGE_TOOL, params=params),
+        ToolSpec(name=RECEIVE_MESSAGES_TOOL, params=params),
+    ])
     
     return agent
 
-def run_agent_conversation(agent_id: str, agent, initial_message: str, conversation_steps: int = 3):
-    """Run a conversation for a specific agent."""
-    print(f"\n🤖 Starting conversation for Agent {agent_id}")
-    print("=" * 50)
+def _send_and_run(conversation: Conversation, message: str) -> None:
+    """Send a message and run the conversation to completion (blocking)."""
+    conversation.send_message(message)
+    conversation.run()
+
+async def run_agent_conversation(agent_id: str, agent, bus: MessageBus, initial_message: str, exchanges: int = 3, wait_for_message: bool = False):
+    """Run a conversation for a specific agent.
+    
+    The agent gets one prompt and a single conversation.run() with an
+    iteration budget, and drives the exchange with its messaging tools rather
+    than being re-prompted every step. All blocking SDK calls run in a worker
+    thread via asyncio.to_thread, so both agents make progress while either
+    one is setting up or waiting on the LLM.
+    
+    If wait_for_message is set, block until something lands in this agent's
+    mailbox (or FIRST_MESSAGE_TIMEOUT passes) before starting. The
+    conversation is built first, so the agent's setup overlaps that wait.
+    """
+    # Conversation() initializes the agent's tools (including the bash/tmux
+    # session), so build it off the event loop and before any waiting
+    conversation = await asyncio.to_thread(
+        Conversation, agent=agent, max_iteration_per_run=MAX_ITERATIONS_PER_RUN
+    )
     
-    conversation = Conversation(agent=agent)
+    if wait_for_message:
+        # The receive tool clears the event, so only wait on it here
+        _, event = bus.queues[agent_id]
+        await asyncio.to_thread(event.wait, FIRST_MESSAGE_TIMEOUT)
     
-    # Send initial message
-    conversation.send_message(initial_message)
-    conversation.run()
+    print(f"\n🤖 Starting conversation for Agent {agent_id}")
+    print("=" * 50)
     
-    # Continue conversation for specified steps
-    for step in range(conversation_steps):
-        print(f"\n📨 Agent {agent_id} - Step {step + 1}: Checking for messages and responding...")
-        
-        # Check for messages and respond
-        if agent_id == "Alice":
-            other_agent = "Bob"
-        else:
-            other_agent = "Alice"
-            
-        check_message = f"Please check for any messages from {other_agent} using your receive_messages tool, and if you receive any, respond appropriately using your send_message tool."
-        
-        conversation.send_message(check_message)
-        conversation.run()
-        
-        # Brief pause between steps
-        time.sleep(2)
+    # Send initial message along with the instructions for the whole exchange
+    message = initial_message + EXCHANGE_TEMPLATE.format(
+        agent_id=agent_id, peer=PEERS[agent_id], exchanges=exchanges, timeout=REPLY_TIMEOUT
+    )
+    await asyncio.to_thread(_send_and_run, conversation, message)
     
     print(f"✅ Agent {agent_id} conversation completed")
 
+async def run_conversations(conversations: Dict[str, Awaitable[None]]):
+    """Run agent conversations concurrently and wait for all of them.
+    
+    A failure in one agent's conversation is reported rather than raised, so
+    the other agents still finish and the final report still prints.
+    """
+    results = await asyncio.gather(*conversations.values(), return_exceptions=True)
+    for agent_id, result in zip(conversations, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Agent {agent_id} conversation failed", exc_info=result)
+            print(f"❌ Agent {agent_id} conversation failed: {result!r}")
+
 def main():
     """Main function to demonstrate inter-agent communication."""
     
@@ -247,8 +334,9 @@ def main():
     # Create two agents with messaging capabilities
     print("👥 Creating Agent Alice and Agent Bob...")
     
-    agent_alice = create_agent_with_messaging("Alice", llm, cwd)
-    agent_bob = create_agent_with_messaging("Bob", llm, cwd)
+    bus = MessageBus()
+    agent_alice = create_agent_with_messaging("Alice", llm, cwd, bus, peer_ids=(PEERS["Alice"],))
+    agent_bob = create_agent_with_messaging("Bob", llm, cwd, bus, peer_ids=(PEERS["Bob"],))
     
     print("✅ Both agents created successfully!")
     
@@ -274,44 +362,25 @@ def main():
     
     print("\n🎭 Starting parallel conversations...")
     
-    # Create threads for each agent conversation
-    alice_thread = threading.Thread(
-        target=run_agent_conversation,
-        args=("Alice", agent_alice, alice_initial, 4),
-        name="Alice-Thread"
-    )
-    
-    bob_thread = threading.Thread(
-        target=run_agent_conversation, 
-        args=("Bob", agent_bob, bob_initial, 4),
-        name="Bob-Thread"
-    )
-    
-    # Start both conversations
-    alice_thread.start()
-    time.sleep(3)  # Give Alice a head start to send the first message
-    bob_thread.start()
-    
-    # Wait for both conversations to complete
-    alice_thread.join()
-    bob_thread.join()
+    # Run both conversations concurrently; Bob blocks until Alice's first
+    # message arrives
+    asyncio.run(run_conversations({
+        "Alice": run_agent_conversation("Alice", agent_alice, bus, alice_initial, 4),
+        "Bob": run_agent_conversation("Bob", agent_bob, bus, bob_initial, 4, wait_for_message=True),
+    }))
     
     print("\n" + "=" * 60)
     print("🎉 Inter-Agent Communication Demo Completed!")
     print("\n📊 Final Message Queue Status:")
     
-    for agent_id, queue in agent_queues.items():
-        remaining_messages = []
-        while not queue.empty():
-            try:
-                remaining_messages.append(queue.get_nowait())
-            except Empty:
-                break
+    for agent_id, (queue, _) in bus.queues.items():
+        remaining_messages = _drain(queue)
         
         if remaining_messages:
-            print(f"📬 {agent_id} has {len(remaining_messages)} unread messages:")
-            for msg in remaining_messages:
-                print(f"   • {msg}")
+            print(
+                f"📬 {agent_id} has {len(remaining_messages)} unread messages:\n   • "
+                + "\n   • ".join(remaining_messages)
+            )
         else:
             print(f"📭 {agent_id} has no unread messages")
 
@@ -2,8 +2,12 @@
 """
 Simple Hello World example using OpenHands Agent SDK with Anthropic Claude.
 This example demonstrates basic agent setup and conversation flow.
+
+By default both tasks are sent as a single prompt so the agent handles them in
+one run; pass --staged to send them as two separate turns instead.
 """
 
+import argparse
 import os
 import sys
 from pydantic import SecretStr
@@ -17,7 +21,18 @@ from openhands.sdk.preset.default import get_default_agent
 # Set up logging
 logger = get_logger(__name__)
 
+FIRST_TASK = "tell me what the current date and time is, and also show me what files are in the current directory"
+SECOND_TASK = "create a simple Python file called 'hello_world.py' that prints 'Hello, World from OpenHands!' and then run it to show me the output"
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="Send the two tasks as separate turns (one extra LLM round-trip)",
+    )
+    args = parser.parse_args()
+    
     # Configure LLM with Anthropic Claude
     api_key = os.getenv("ANTHROPIC_API_KEY")
     if not api_key:
@@ -47,26 +62,30 @@ def main():
     print("\n🚀 Starting conversation...")
     print("=" * 60)
     
-    # Send a simple message that doesn't require file creation
-    conversation.send_message(
-        "Hello! Please tell me what the current date and time is, and also show me what files are in the current directory."
-    )
-    
-    # Run the conversation
-    conversation.run()
-    
-    print("=" * 60)
-    print("✨ First conversation completed!")
-    
-    # Send another message to demonstrate continued conversation
-    print("\n🔄 Continuing conversation...")
-    print("=" * 60)
-    
-    conversation.send_message(
-        "Great! Now please create a simple Python file called 'hello_world.py' that prints 'Hello, World from OpenHands!' and then run it to show me the output."
-    )
-    
-    conversation.run()
+    if not args.staged:
+        # Send both tasks in one message so the agent plans and executes them
+        # in a single run
+        conversation.send_message(
+            f"Hello! Please do the following:\n1. {FIRST_TASK}.\n2. {SECOND_TASK}."
+        )
+        conversation.run()
+    else:
+        # Send a simple message that doesn't require file creation
+        conversation.send_message(f"Hello! Please {FIRST_TASK}.")
+        
+        # Run the conversation
+        conversation.run()
+        
+        print("=" * 60)
+        print("✨ First conversation completed!")
+        
+        # Send another message to demonstrate continued conversation
+        print("\n🔄 Continuing conversation...")
+        print("=" * 60)
+        
+        conversation.send_message(f"Great! Now please {SECOND_TASK}.")
+        
+        conversation.run()
     
     print("=" * 60)
     print("🎉 All done! The OpenHands Agent SDK is working with Anthropic Claude!")